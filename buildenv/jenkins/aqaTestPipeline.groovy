@@ -351,6 +351,11 @@ def runTestComparison(baseUrl) {
     def currentUrl = "${env.BUILD_URL}"
 
     node("worker || (ci.role.test && hw.arch.x86 && sw.os.linux)") {
+        // Kept outside the workspace so cleanWs() does not discard the exported model
+        // or the embedding and parse caches;
+        // single-quoted so $HOME is expanded by the agent's shell
+        def cacheDir = '$HOME/.cache/aqa_compare_tap'
+
         cleanWs()
         checkout scm
 
@@ -358,17 +363,20 @@ def runTestComparison(baseUrl) {
             python3 -m venv venv
             . venv/bin/activate
             pip install --upgrade pip
-            pip install sentence-transformers torch bs4 requests
+            pip install "optimum[onnxruntime]" bs4 lxml requests rapidfuzz
         """
 
-        sh "mkdir -p results"
+        sh "mkdir -p results \"${cacheDir}\""
 
         sh """
             . venv/bin/activate
             python3 compare_tap.py \
                 --base-url '${baseUrl}' \
                 --current-url '${currentUrl}' \
-                --output results/comparison_results.txt
+                --output results/comparison_results.txt \
+                --model-dir "${cacheDir}" \
+                --embed-cache "${cacheDir}/embed_cache.sqlite" \
+                --parse-cache "${cacheDir}/tap_cache"
         """
 
         archiveArtifacts artifacts: "results/comparison_results.txt", fingerprint: true
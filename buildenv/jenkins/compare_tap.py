@@ -1,14 +1,24 @@
 #!/usr/bin/env python3
 import argparse
+import functools
+import hashlib
+import html
 import os
+import pickle
 import re
+import shutil
+import sqlite3
+import time
 import requests
-import difflib
-import torch
+import numpy as np
+import onnxruntime
 from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
+from rapidfuzz import fuzz, process
+from requests.adapters import HTTPAdapter
 from urllib.parse import urljoin
-from sentence_transformers import SentenceTransformer, util
-from io import StringIO
+from transformers import AutoTokenizer
+from contextlib import closing
 
 
 # ======================================================
@@ -18,61 +28,294 @@ parser = argparse.ArgumentParser(description="Jenkins TAP Comparison Tool")
 parser.add_argument("--base-url", required=True, help="Old Jenkins build URL")
 parser.add_argument("--current-url", required=True, help="New Jenkins build URL")
 parser.add_argument("--output", required=True, help="Output file path for comparison results")
+parser.add_argument("--embed-cache", default="embed_cache.sqlite", help="SQLite file caching line embeddings across runs")
+parser.add_argument("--parse-cache", default=".tap_cache", help="Directory caching parsed TAP sections across runs")
+parser.add_argument("--model-dir", default=".", help="Directory holding the exported ONNX model across runs")
 
 args = parser.parse_args()
 BASE_URL = args.base_url
 CURRENT_URL = args.current_url
 OUTPUT_FILE = args.output
+EMBED_CACHE_FILE = args.embed_cache
+PARSE_CACHE_DIR = args.parse_cache
+MODEL_ROOT = args.model_dir
 
 
 # ======================================================
 # Load Transformer Model (cached)
 # ======================================================
-print("[INFO] Loading ML model (MiniLM-L6-v2)...")
-model = SentenceTransformer('all-MiniLM-L6-v2')
+MODEL_ID = 'sentence-transformers/all-MiniLM-L6-v2'
+
+# Per variant: model subdirectory, ONNX file, execution provider and the name
+# that namespaces the embedding cache (bump it whenever the weights change).
+# int8 dynamic quantization only has CPU kernels; on a usable GPU run FP16 instead.
+MODEL_VARIANTS = {
+    'fp16': ('minilm_onnx_fp16', 'model_optimized.onnx', 'CUDAExecutionProvider', 'all-MiniLM-L6-v2-onnx-fp16'),
+    'int8': ('minilm_onnx_int8', 'model_quantized.onnx', 'CPUExecutionProvider', 'all-MiniLM-L6-v2-onnx-int8'),
+}
+
+# Matches the max_seq_length sentence-transformers uses for this model
+MAX_SEQ_LENGTH = 256
+ENCODE_BATCH_SIZE = 1024
+
+
+def thread_count():
+    """Intra-op thread count: OMP_NUM_THREADS if set, else the CPUs this process may use.
+
+    Returns None, leaving ONNX Runtime's default, when OMP_NUM_THREADS is unusable.
+    """
+    value = os.environ.get("OMP_NUM_THREADS")
+
+    if value is None:
+        # Honours cpusets/affinity masks, unlike os.cpu_count()
+        if hasattr(os, "sched_getaffinity"):
+            return len(os.sched_getaffinity(0))
+        return os.cpu_count()
+
+    try:
+        # The nested form "4,2" lists the outermost level first
+        threads = int(value.split(",")[0])
+    except ValueError:
+        return None
+
+    return threads if threads > 0 else None
+
+
+# Inference only: let ONNX Runtime use every core for the MatMuls
+NUM_THREADS = thread_count()
+
+
+# Written when the FP16 build cannot run on CUDA here, so later runs skip straight
+# to int8 instead of repeating the hub download and export; delete it to retry
+FP16_UNAVAILABLE_MARKER = os.path.join(MODEL_ROOT, 'fp16_unavailable')
+
+
+def cuda_provider_installed():
+    # Only says onnxruntime-gpu is installed, not that a usable GPU exists
+    return "CUDAExecutionProvider" in onnxruntime.get_available_providers()
+
+
+def try_gpu_model():
+    return cuda_provider_installed() and not os.path.exists(FP16_UNAVAILABLE_MARKER)
+
+
+def record_gpu_failure(reason):
+    print(f"[WARN] FP16 GPU model unavailable, using int8 on CPU: {reason}")
+    os.makedirs(MODEL_ROOT, exist_ok=True)
+    with open(FP16_UNAVAILABLE_MARKER, "w") as f:
+        f.write(f"{reason}\n")
+
+
+def model_ready(model_dir, model_file):
+    return (os.path.exists(os.path.join(model_dir, model_file))
+            and os.path.exists(os.path.join(model_dir, "tokenizer.json")))
+
+
+def export_model(variant):
+    """Export and save one model variant with its tokenizer.
+
+    Everything is written to a private temp directory that is moved into place
+    last, so an aborted export or a concurrent job never leaves a partial model
+    in the persistent model directory.
+    """
+    # optimum (and the torch stack it drives) is only needed for this one-off export
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTOptimizer, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoOptimizationConfig, AutoQuantizationConfig
+
+    model_subdir, model_file, _, _ = MODEL_VARIANTS[variant]
+    model_dir = os.path.join(MODEL_ROOT, model_subdir)
+    tmp_dir = f"{model_dir}.{os.getpid()}.tmp"
+
+    try:
+        if variant == 'fp16':
+            print("[INFO] Exporting MiniLM-L6-v2 to ONNX with FP16 GPU optimizations...")
+            ort_model = ORTModelForFeatureExtraction.from_pretrained(MODEL_ID, export=True,
+                                                                     provider="CUDAExecutionProvider")
+            optimizer = ORTOptimizer.from_pretrained(ort_model)
+            optimizer.optimize(save_dir=tmp_dir, optimization_config=AutoOptimizationConfig.O4())
+        else:
+            print("[INFO] Exporting MiniLM-L6-v2 to ONNX with int8 dynamic quantization...")
+            ort_model = ORTModelForFeatureExtraction.from_pretrained(MODEL_ID, export=True)
+            quantizer = ORTQuantizer.from_pretrained(ort_model)
+            qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+            quantizer.quantize(save_dir=tmp_dir, quantization_config=qconfig)
+
+        AutoTokenizer.from_pretrained(MODEL_ID).save_pretrained(tmp_dir)
+
+        if model_ready(model_dir, model_file):
+            return  # a concurrent job finished first
+
+        # Clear out a partial directory left behind by an older, non-atomic export
+        shutil.rmtree(model_dir, ignore_errors=True)
+        try:
+            os.replace(tmp_dir, model_dir)
+        except OSError:
+            if not model_ready(model_dir, model_file):
+                raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def load_model(variant):
+    """Load the tokenizer and ONNX Runtime session, exporting the model on first use."""
+    model_subdir, model_file, provider, _ = MODEL_VARIANTS[variant]
+    model_dir = os.path.join(MODEL_ROOT, model_subdir)
+
+    if not model_ready(model_dir, model_file):
+        export_model(variant)
+
+    session_options = onnxruntime.SessionOptions()
+    if NUM_THREADS:
+        session_options.intra_op_num_threads = NUM_THREADS
+
+    session = onnxruntime.InferenceSession(os.path.join(model_dir, model_file), session_options,
+                                           providers=[provider, "CPUExecutionProvider"])
+    return AutoTokenizer.from_pretrained(model_dir), session
+
+
+def load_gpu_model():
+    """Load the FP16 build, or return None if no CUDA device actually serves it."""
+    try:
+        tokenizer, session = load_model('fp16')
+    except Exception as e:
+        record_gpu_failure(e)
+        return None
+
+    # onnxruntime silently falls back to CPU when the CUDA provider cannot start
+    if session.get_providers()[0] != "CUDAExecutionProvider":
+        record_gpu_failure("CUDA execution provider did not initialize")
+        return None
+
+    return tokenizer, session
+
+
+@functools.lru_cache(maxsize=1)
+def get_model():
+    """Load the model on first use only.
+
+    Runs that abort early, or whose lines all match exactly or hit the
+    embedding cache, never pay for the load (or the first-run export);
+    model_name() predicts the variant so cache lookups do not load it either.
+    """
+    variant = 'fp16'
+    loaded = load_gpu_model() if try_gpu_model() else None
+
+    if loaded is None:
+        variant, loaded = 'int8', load_model('int8')
+
+    print(f"[INFO] Loaded ML model (MiniLM-L6-v2, ONNX {variant})")
+    tokenizer, session = loaded
+    session_inputs = {i.name for i in session.get_inputs()}
+    embedding_dim = session.get_outputs()[0].shape[-1]
+    return variant, tokenizer, session, session_inputs, embedding_dim
+
+
+def model_name():
+    # Predict the variant until the model is loaded, so an all-hit run never loads it;
+    # encode_lines() re-checks after loading in case the FP16 build fell back to int8
+    if get_model.cache_info().currsize:
+        variant = get_model()[0]
+    else:
+        variant = 'fp16' if try_gpu_model() else 'int8'
+    return MODEL_VARIANTS[variant][3]
+
+
+def encode(texts, batch_size=ENCODE_BATCH_SIZE):
+    """Mean-pooled, L2-normalized embeddings as a float32 array.
+
+    Lines are length-sorted before batching so each batch pads only to its
+    own longest line; pass every line in one call rather than chunking.
+    """
+    _, tokenizer, session, session_inputs, embedding_dim = get_model()
+
+    order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+    embeddings = np.empty((len(texts), embedding_dim), dtype=np.float32)
+
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        enc = tokenizer([texts[i] for i in batch], padding=True, truncation=True,
+                        max_length=MAX_SEQ_LENGTH, return_tensors="np")
+
+        # Pool and normalize in FP32 even when the model itself runs in FP16
+        token_embeddings = session.run(None, {k: v for k, v in enc.items() if k in session_inputs})[0]
+        token_embeddings = token_embeddings.astype(np.float32)
+
+        mask = enc["attention_mask"][..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        embeddings[batch] = pooled
+
+    return embeddings
 
 
 # ======================================================
 # Helper: Download TAP files from Jenkins
 # ======================================================
-def download_files(url, extension, download_folder):
-    print(f"[INFO] Looking for '*.{extension}' files at {url}")
+DOWNLOAD_WORKERS = 16
 
-    if not os.path.exists(download_folder):
-        os.makedirs(download_folder)
+
+def fetch_file(session, file_url, file_path):
+    print(f"[INFO] Downloading {os.path.basename(file_path)}")
 
     try:
-        response = requests.get(url)
-        response.raise_for_status()
+        with session.get(file_url, stream=True) as r:
+            r.raise_for_status()
+            with open(file_path, "wb") as f:
+                for chunk in r.iter_content(chunk_size=64 * 1024):
+                    f.write(chunk)
+
+        return file_path
+
     except Exception as e:
-        print(f"[ERROR] Failed to fetch {url}: {e}")
-        return []
+        print(f"[ERROR] Failed to download {file_url}: {e}")
+        return None
 
-    soup = BeautifulSoup(response.text, "html.parser")
-    links = soup.find_all("a", href=True)
 
-    downloaded = []
+def find_links(page, extension):
+    # A directory listing only needs its hrefs; a regex scan avoids building a DOM.
+    # Entities are unescaped the same way BeautifulSoup does for attribute values.
+    pattern = r'href\s*=\s*["\']([^"\']+\.' + re.escape(extension) + r')["\']'
+    hrefs = [html.unescape(h) for h in re.findall(pattern, page, re.IGNORECASE)]
 
-    for link in links:
-        file_url = urljoin(url, link["href"])
+    if not hrefs:
+        soup = BeautifulSoup(page, "lxml")
+        hrefs = [link["href"] for link in soup.find_all("a", href=True)]
 
-        if file_url.lower().endswith(f".{extension.lower()}"):
-            filename = os.path.basename(file_url)
-            file_path = os.path.join(download_folder, filename)
+    return hrefs
 
-            print(f"[INFO] Downloading {filename}")
 
-            try:
-                with requests.get(file_url, stream=True) as r:
-                    r.raise_for_status()
-                    with open(file_path, "wb") as f:
-                        for chunk in r.iter_content(chunk_size=8192):
-                            f.write(chunk)
+def download_files(url, extension, download_folder):
+    print(f"[INFO] Looking for '*.{extension}' files at {url}")
+
+    if not os.path.exists(download_folder):
+        os.makedirs(download_folder)
+
+    with requests.Session() as session:
+        # Keep-alive pool sized so every worker can hold its own connection
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+        try:
+            response = session.get(url)
+            response.raise_for_status()
+        except Exception as e:
+            print(f"[ERROR] Failed to fetch {url}: {e}")
+            return []
+
+        # Keyed by target path so no two workers ever write the same file; as with
+        # the old serial loop, the last URL for a given file name wins
+        targets = {}
+
+        for href in find_links(response.text, extension):
+            file_url = urljoin(url, href)
 
-                downloaded.append(file_path)
+            if file_url.lower().endswith(f".{extension.lower()}"):
+                targets[os.path.join(download_folder, os.path.basename(file_url))] = file_url
 
-            except Exception as e:
-                print(f"[ERROR] Failed to download {file_url}: {e}")
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+            results = pool.map(lambda t: fetch_file(session, t[1], t[0]), targets.items())
+            downloaded = [p for p in results if p is not None]
 
     return downloaded
 
@@ -92,95 +335,323 @@ def is_noise_change(line):
 # ======================================================
 # Log Parsing Helpers
 # ======================================================
-def parse_log_sections(text):
+_RE_TEST_RESULTS = re.compile(rb'(\S+)\s*-\s*Test results:')
+_RE_NOTOK = re.compile(rb'not ok\s+\d+\s*-\s*(\S+)')
+_RE_TEST_POINT = re.compile(rb'(?P<notok>not )?ok\s+\d+\s*-')
+
+
+def _decode(raw):
+    return raw.decode("utf-8", errors="replace")
+
+
+def parse_log_sections(lines, skip_ok=False):
+    """Split raw TAP byte lines into {suite: [lines]} in a single pass.
+
+    lines is any iterable of bytes, typically a binary file object, so large
+    logs are streamed rather than read into memory whole.
+
+    With skip_ok, the lines following an "ok N -" test point are dropped up
+    to the next "not ok" one, and suites left empty are omitted. Cheap prefix
+    and substring checks gate every regex, since most lines are plain output.
+    """
     sections = {}
-    lines = text.splitlines()
     current_suite = None
     current_lines = []
+    skip_mode = False
 
     for line in lines:
         line = line.strip()
 
-        m_old = re.search(r'(\S+)\s*-\s*Test results:', line)
-        m_notok = re.match(r'not ok\s+\d+\s*-\s*(\S+)', line)
-
-        if "- Test results:" in line:
-            suite = m_old.group(1).strip() if m_old else line.split("- Test results:")[0].strip()
+        if b"- Test results:" in line:
+            m_old = _RE_TEST_RESULTS.search(line)
+            suite = m_old.group(1) if m_old else line.split(b"- Test results:")[0]
+            m_notok = _RE_NOTOK.match(line) if line.startswith(b"not ok") else None
 
-        elif m_notok:
-            suite = m_notok.group(1).strip()
+        elif line.startswith(b"not ok") and (m_notok := _RE_NOTOK.match(line)):
+            suite = m_notok.group(1)
 
         else:
-            if current_suite is not None:
-                current_lines.append(line)
+            if current_suite is None:
+                continue
+
+            if skip_ok and line.startswith((b"ok", b"not ok")):
+                m = _RE_TEST_POINT.match(line)
+                if m:
+                    skip_mode = not m.group('notok')
+
+            if not skip_mode:
+                current_lines.append(_decode(line))
             continue
 
         if current_suite is not None:
             sections[current_suite] = current_lines
 
-        current_suite = suite
-        current_lines = [line] if m_notok else []
+        current_suite = _decode(suite.strip())
+        current_lines = [_decode(line)] if m_notok else []
+        skip_mode = False
 
     if current_suite is not None:
         sections[current_suite] = current_lines
 
+    if skip_ok:
+        sections = {s: l for s, l in sections.items() if l}
+
     return sections
 
 
-def filter_ok_tests(lines):
-    filtered = []
-    skip_mode = False
+# Bump whenever parse_log_sections changes what it returns
+PARSE_CACHE_VERSION = 1
+# Entries (and stale temp files) not used for this long are pruned on startup
+PARSE_CACHE_MAX_AGE_DAYS = 14
 
-    for line in lines:
-        stripped = line.strip()
 
-        if re.match(r'ok\s+\d+\s*-', stripped):
-            skip_mode = True
-            continue
+def prune_parse_cache(max_age_days=PARSE_CACHE_MAX_AGE_DAYS):
+    if not os.path.isdir(PARSE_CACHE_DIR):
+        return
+
+    cutoff = time.time() - max_age_days * 86400
+    pruned = 0
 
-        if re.match(r'not ok\s+\d+\s*-', stripped):
-            skip_mode = False
-            filtered.append(line)
+    for entry in os.scandir(PARSE_CACHE_DIR):
+        if not entry.name.endswith((".pkl", ".tmp")):
             continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                pruned += 1
+        except FileNotFoundError:
+            pass  # removed by a concurrent job
+
+    if pruned:
+        print(f"[INFO] Parse cache: pruned {pruned} entries unused for {max_age_days} days")
+
+
+def load_log_sections(file_path, skip_ok=False):
+    """parse_log_sections for a file, memoized on disk by content hash.
+
+    Jenkins artifacts never change once archived, so a hit is always valid.
+    """
+    with open(file_path, "rb") as f:
+        # Hash in fixed-size chunks, then stream the same handle into the
+        # parser on a miss; the file is never held in memory whole
+        sha1 = hashlib.sha1()
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(chunk)
+
+        mode = "skip_ok" if skip_ok else "all"
+        cache_path = os.path.join(PARSE_CACHE_DIR, f"{sha1.hexdigest()}-v{PARSE_CACHE_VERSION}-{mode}.pkl")
+
+        if os.path.exists(cache_path):
+            with open(cache_path, "rb") as cached:
+                sections = pickle.load(cached)
+            try:
+                # Mark the entry as used so pruning keeps it
+                os.utime(cache_path)
+            except FileNotFoundError:
+                pass  # pruned by a concurrent job after we loaded it
+            return sections
+
+        f.seek(0)
+        sections = parse_log_sections(f, skip_ok=skip_ok)
+
+    os.makedirs(PARSE_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(sections, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, cache_path)
+
+    return sections
+
+
+def clean_lines(lines):
+    return [ln.strip() for ln in lines if ln.strip()]
+
+
+def changed_lines(old_lines, new_lines):
+    """Clean both sides and drop new lines that appear verbatim in the old ones.
+
+    An exact match can never be reported as a change, so those lines never
+    need to be embedded.
+    """
+    old_lines = clean_lines(old_lines)
+    old_set = set(old_lines)
+    return old_lines, [ln for ln in clean_lines(new_lines) if ln not in old_set]
+
+
+_RE_NON_ALNUM = re.compile(r'[^a-z0-9]')
+
+
+def normalize_suite_name(name):
+    return _RE_NON_ALNUM.sub('', name.lower())
+
+
+def build_suite_index(old_sections):
+    """Index old suite names by their normalized form, first one winning."""
+    old_norm = {}
+
+    for name in old_sections:
+        key = normalize_suite_name(name)
+        if key:
+            old_norm.setdefault(key, name)
+
+    return old_norm
+
+
+def match_suite(suite_name, old_sections, old_norm, old_names):
+    if suite_name in old_sections:
+        return suite_name
+
+    # Names that differ only in casing or punctuation resolve without a fuzzy scan
+    matched = old_norm.get(normalize_suite_name(suite_name))
+    if matched is not None:
+        return matched
+
+    close = process.extractOne(suite_name, old_names, scorer=fuzz.ratio, score_cutoff=60)
+    return close[0] if close else None
+
+
+# ======================================================
+# Embedding Helpers
+# ======================================================
+# SQLite caps the number of bound parameters per statement
+CACHE_QUERY_CHUNK = 900
+# Least recently used vectors beyond this are pruned (~800 bytes per row)
+EMBED_CACHE_MAX_ROWS = 100_000
+
+
+def line_hash(line, namespace):
+    # Namespace by model so a model change never serves stale vectors
+    return hashlib.sha1(f"{namespace}\0{line}".encode()).digest()
+
+
+def open_embed_cache(path):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE IF NOT EXISTS embeddings "
+                 "(hash BLOB PRIMARY KEY, vec BLOB, last_used INTEGER NOT NULL DEFAULT 0)")
+
+    # Caches written before pruning existed lack the column; their rows go first
+    if "last_used" not in {row[1] for row in conn.execute("PRAGMA table_info(embeddings)")}:
+        conn.execute("ALTER TABLE embeddings ADD COLUMN last_used INTEGER NOT NULL DEFAULT 0")
+
+    conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+    return conn
+
+
+def load_cached_embeddings(conn, hashes, now):
+    cached = {}
+
+    for start in range(0, len(hashes), CACHE_QUERY_CHUNK):
+        chunk = hashes[start:start + CACHE_QUERY_CHUNK]
+        placeholders = ",".join("?" * len(chunk))
+        rows = conn.execute(f"SELECT hash, vec FROM embeddings WHERE hash IN ({placeholders})", chunk)
+
+        for h, vec in rows:
+            cached[h] = np.frombuffer(vec, dtype=np.float16).astype(np.float32)
 
-        if not skip_mode:
-            filtered.append(line)
+        conn.execute(f"UPDATE embeddings SET last_used = ? WHERE hash IN ({placeholders})", [now, *chunk])
 
-    return filtered
+    return cached
 
 
-def compare_sections(old_lines, new_lines, threshold_main=0.88, threshold_fallback=0.85, difflib_cutoff=0.87):
-    old_lines = [ln.strip() for ln in old_lines if ln.strip()]
-    new_lines = [ln.strip() for ln in new_lines if ln.strip()]
+def prune_embed_cache(conn, max_rows=EMBED_CACHE_MAX_ROWS):
+    deleted = conn.execute(
+        "DELETE FROM embeddings WHERE hash IN "
+        "(SELECT hash FROM embeddings ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+        (max_rows,),
+    ).rowcount
+
+    if deleted:
+        print(f"[INFO] Embedding cache: pruned {deleted} least recently used vectors")
+
+
+def encode_lines(lines):
+    """Encode every unique line in a single batch.
+
+    Vectors already present in the on-disk cache are reused, and only the
+    misses go through the model. Returns the L2-normalized embedding matrix
+    and a dict mapping each line to its row, so callers can slice per-suite
+    embeddings without re-entering the model.
+    """
+    unique_lines = list(set(lines))
+    line_index = {ln: i for i, ln in enumerate(unique_lines)}
+
+    if not unique_lines:
+        return None, line_index
+
+    namespace = model_name()
+    hashes = [line_hash(ln, namespace) for ln in unique_lines]
+    now = int(time.time())
+
+    with closing(open_embed_cache(EMBED_CACHE_FILE)) as conn:
+        vectors = load_cached_embeddings(conn, hashes, now)
+
+        missing = [i for i, h in enumerate(hashes) if h not in vectors]
+        print(f"[INFO] Embedding cache: {len(hashes) - len(missing)} hits, {len(missing)} misses")
+
+        if missing:
+            encoded = encode([unique_lines[i] for i in missing])
+
+            if model_name() != namespace:
+                # The predicted FP16 build failed to load; redo the lookup under int8
+                return encode_lines(lines)
+
+            # Use the float16 values that get cached, so cold and warm runs score identically
+            encoded = encoded.astype(np.float16)
+
+            for i, vec in zip(missing, encoded):
+                vectors[hashes[i]] = vec.astype(np.float32)
+
+            conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (hash, vec, last_used) VALUES (?, ?, ?)",
+                [(hashes[i], vec.tobytes(), now) for i, vec in zip(missing, encoded)],
+            )
+            prune_embed_cache(conn)
+
+        conn.commit()
+
+    embeddings = np.stack([vectors[h] for h in hashes])
+
+    # float16 cache entries drift slightly off unit length; renormalize once here
+    # so every suite comparison can use a plain matmul as its cosine similarity
+    embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    return embeddings, line_index
+
+
+def compare_sections(old_lines, new_lines, embeddings, line_index,
+                     threshold_main=0.88, threshold_fallback=0.85, difflib_cutoff=0.87):
+    old_lines, new_lines = changed_lines(old_lines, new_lines)
 
     if not old_lines or not new_lines:
         return new_lines.copy()
 
-    emb_old = model.encode(old_lines, convert_to_tensor=True)
-    emb_new = model.encode(new_lines, convert_to_tensor=True)
-
-    sims = util.cos_sim(emb_new, emb_old)
-    max_scores, max_indices = sims.max(dim=1)
+    # Score each distinct line once; repeats (e.g. "TEST:" banners) share the result
+    old_lines = list(dict.fromkeys(old_lines))
+    unique_new = list(dict.fromkeys(new_lines))
 
-    max_scores = max_scores.detach().cpu().numpy()
-    max_indices = max_indices.detach().cpu().numpy()
+    emb_old = embeddings[[line_index[ln] for ln in old_lines]]
+    emb_new = embeddings[[line_index[ln] for ln in unique_new]]
 
-    changes = []
+    # Embeddings are pre-normalized, so the dot product is the cosine similarity
+    sims = emb_new @ emb_old.T
+    max_indices = sims.argmax(axis=1)
+    max_scores = sims[np.arange(len(unique_new)), max_indices]
 
-    for i, score in enumerate(max_scores):
-        new_line = new_lines[i]
-        old_line = old_lines[max_indices[i]]
+    # Classify with array masks; only the lexical fallback needs Python-level work
+    definitive = np.flatnonzero(max_scores < threshold_main)
+    borderline = np.flatnonzero((max_scores >= threshold_main) & (max_scores > threshold_fallback))
 
-        if score < threshold_main:
-            changes.append(new_line)
+    flagged = {unique_new[i]: unique_new[i] for i in definitive.tolist()}
 
-        elif score > threshold_fallback:
-            ratio = difflib.SequenceMatcher(None, new_line, old_line).ratio()
+    # fuzz.ratio stands in for difflib's SequenceMatcher.ratio(); the "difflib="
+    # label is kept so the archived report format does not change
+    for i, j in zip(borderline.tolist(), max_indices[borderline].tolist()):
+        ratio = fuzz.ratio(unique_new[i], old_lines[j]) / 100.0
 
-            if ratio < difflib_cutoff:
-                changes.append(f"{new_line} (difflib={ratio:.2f})")
+        if ratio < difflib_cutoff:
+            flagged[unique_new[i]] = f"{unique_new[i]} (difflib={ratio:.2f})"
 
-    return changes
+    # Report changes in log order, once per occurrence
+    return [flagged[ln] for ln in new_lines if ln in flagged]
 
 
 # ======================================================
@@ -197,74 +668,83 @@ if not old_files or not new_files:
     exit(1)
 
 print("[INFO] Parsing and comparing logs...")
-output = StringIO()
+prune_parse_cache()
 
 old_sections = {}
 old_suite_sources = {}
 
 for file_path in old_files:
-    with open(file_path, "r") as f:
-        text = f.read()
-
-    parsed = parse_log_sections(text)
+    parsed = load_log_sections(file_path)
 
     for suite, lines in parsed.items():
         old_sections.setdefault(suite, []).extend(lines)
         old_suite_sources.setdefault(suite, set()).add(os.path.basename(file_path))
 
+old_norm = build_suite_index(old_sections)
+old_names = list(old_sections)
+
+new_logs = []
+
 for file_path in new_files:
-    output.write(f"===== NEW LOG: {os.path.basename(file_path)} =====\n")
+    new_sections = load_log_sections(file_path, skip_ok=True)
 
-    with open(file_path, "r") as f:
-        text = f.read()
+    matches = {s: match_suite(s, old_sections, old_norm, old_names) for s in new_sections}
+    new_logs.append((file_path, new_sections, matches))
 
-    new_sections = parse_log_sections(text)
-    new_sections = {s: filter_ok_tests(l) for s, l in new_sections.items()}
-    new_sections = {s: l for s, l in new_sections.items() if l}
+# Encode every line that still needs a semantic comparison up front, in one batch
+all_lines = set()
 
-    output.write("Parsed suites: " + ", ".join(new_sections.keys()) + "\n\n")
+for _, new_sections, matches in new_logs:
+    for suite_name, matched in matches.items():
+        if matched is None:
+            continue
 
-    for suite_name in new_sections:
-        matched = None
+        old_lines, new_lines = changed_lines(old_sections[matched], new_sections[suite_name])
 
-        if suite_name in old_sections:
-            matched = suite_name
+        if old_lines and new_lines:
+            all_lines.update(old_lines)
+            all_lines.update(new_lines)
 
-        else:
-            close = difflib.get_close_matches(suite_name, old_sections.keys(), n=1, cutoff=0.6)
-            if close:
-                matched = close[0]
-                output.write(f"Fuzzy match: '{suite_name}' → '{matched}'\n")
-            else:
+print(f"[INFO] Encoding {len(all_lines)} unique lines...")
+embeddings, line_index = encode_lines(all_lines)
+
+# ======================================================
+# Write output
+# ======================================================
+# Stream the report straight to disk instead of building it in memory first
+print(f"[INFO] Writing results to {OUTPUT_FILE}")
+
+with open(OUTPUT_FILE, "w", buffering=1 << 20) as output:
+    for file_path, new_sections, matches in new_logs:
+        output.write(f"===== NEW LOG: {os.path.basename(file_path)} =====\n")
+        output.write("Parsed suites: " + ", ".join(new_sections.keys()) + "\n\n")
+
+        for suite_name, matched in matches.items():
+            if matched is None:
                 output.write(f"[NEW] Suite without match: {suite_name}\n")
                 for ln in new_sections[suite_name]:
                     output.write(f"   + {ln}\n")
                 output.write("\n")
                 continue
 
-        old_sources = ", ".join(sorted(old_suite_sources.get(matched, [])))
-        output.write(f"Comparing suite '{suite_name}' (from {old_sources})\n")
-
-        changes = compare_sections(old_sections[matched], new_sections[suite_name])
+            if matched != suite_name:
+                output.write(f"Fuzzy match: '{suite_name}' → '{matched}'\n")
 
-        noise = [c for c in changes if is_noise_change(c)]
-        real = [c for c in changes if not is_noise_change(c)]
+            old_sources = ", ".join(sorted(old_suite_sources.get(matched, [])))
+            output.write(f"Comparing suite '{suite_name}' (from {old_sources})\n")
 
-        if real:
-            output.write("Real semantic changes:\n")
-            for c in real:
-                output.write(f"   - {c}\n")
-        else:
-            output.write("No meaningful test differences.\n")
+            changes = compare_sections(old_sections[matched], new_sections[suite_name], embeddings, line_index)
 
-        output.write("\n")
+            noise = [c for c in changes if is_noise_change(c)]
+            real = [c for c in changes if not is_noise_change(c)]
 
+            if real:
+                output.write("Real semantic changes:\n")
+                for c in real:
+                    output.write(f"   - {c}\n")
+            else:
+                output.write("No meaningful test differences.\n")
 
-# ======================================================
-# Write output
-# ======================================================
-print(f"[INFO] Writing results to {OUTPUT_FILE}")
-with open(OUTPUT_FILE, "w") as f:
-    f.write(output.getvalue())
+            output.write("\n")
 
 print("[INFO] Comparison complete.")